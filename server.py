@@ -7,13 +7,33 @@ It provides comprehensive network scanning capabilities through the Nmap command
 """
 
 import asyncio
+import hashlib
+import ipaddress
 import json
-import subprocess
+import math
+import mmap
+import os
+import re
+import shlex
+import shutil
+import socket
 import sys
+import tempfile
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+# lxml (libxml2) parses nmap XML several times faster than the stdlib parser
+try:
+    from lxml import etree as ET
+    _HAS_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    _HAS_LXML = False
 
 from mcp.server import FastMCP
+from mcp.server.fastmcp import Context
 from mcp.types import (
     CallToolRequest,
     CallToolResult,
@@ -28,53 +48,566 @@ from mcp.types import (
 )
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (LOG_LEVEL=WARNING silences per-scan messages)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+_log_level_valid = isinstance(logging.getLevelName(LOG_LEVEL), int)
+logging.basicConfig(level=LOG_LEVEL if _log_level_valid else logging.INFO)
 logger = logging.getLogger(__name__)
+if not _log_level_valid:
+    logger.warning("Unknown LOG_LEVEL %r, using INFO", LOG_LEVEL)
 
 # Initialize the FastMCP server
 app = FastMCP("nmap-mcp-server")
 
-def run_nmap_command(args: List[str], timeout: int = 300) -> Dict[str, Any]:
+# Cap on nmap processes running at once, shared by every tool
+MAX_CONCURRENT_SCANS = max(1, int(os.getenv("NMAP_MAX_CONCURRENCY", os.cpu_count() or 4)))
+_SCAN_SEM = asyncio.Semaphore(MAX_CONCURRENT_SCANS)
+
+# Successful scan results are reused for CACHE_TTL seconds (0 disables caching)
+CACHE_TTL = int(os.getenv("NMAP_CACHE_TTL", 3600))
+CACHE_SIZE = int(os.getenv("NMAP_CACHE_SIZE", 128))
+CACHE_DIR = Path(os.getenv("NMAP_CACHE_DIR", Path.home() / ".cache" / "nmap-mcp"))
+_result_cache: "OrderedDict[Tuple[str, ...], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+# Scans currently running, keyed like the cache, so identical calls share one nmap process
+_inflight_scans: Dict[Tuple[str, ...], "asyncio.Future[Dict[str, Any]]"] = {}
+
+# Latest status ("up" or "down") seen for each scanned IP; heavy scans skip
+# targets that were down within DOWN_TTL seconds (0 disables skipping)
+DOWN_TTL = int(os.getenv("NMAP_DOWN_TTL", 300))
+_host_status: Dict[str, Tuple[float, str]] = {}
+
+# Defaults added to every scan unless the caller sets them; an empty value
+# disables the corresponding default
+HOST_TIMEOUT = os.getenv("NMAP_HOST_TIMEOUT", "5m")
+MAX_RETRIES = os.getenv("NMAP_MAX_RETRIES", "3")
+DEFEAT_RST_RATELIMIT = os.getenv("NMAP_DEFEAT_RST_RATELIMIT", "1") not in ("", "0")
+STATS_EVERY = os.getenv("NMAP_STATS_EVERY", "5s")
+
+# Scan type options; nmap only accepts --defeat-rst-ratelimit with a SYN scan
+_SCAN_TYPE_OPTIONS = frozenset({
+    "-sS", "-sT", "-sA", "-sW", "-sM", "-sU", "-sN", "-sF", "-sX", "-sY", "-sZ",
+    "-sO", "-sI", "-sn", "-sL",
+})
+
+# Progress reports nmap writes while --stats-every is active: a <taskprogress>
+# element in XML output, a "<task> Timing: About N% done" line in normal output
+_TASKPROGRESS_RE = re.compile(rb'<taskprogress task="([^"]*)"[^>]*? percent="([\d.]+)"')
+_TIMING_RE = re.compile(rb"^(.+?) Timing: About ([\d.]+)% done")
+
+def parse_progress(line: bytes) -> Optional[Tuple[float, str]]:
+    """
+    Extract (percent, task) from an nmap progress line, or None.
+    
+    A cheap prefix/substring test rejects the vast majority of lines before
+    any regular expression runs, so scanning large outputs stays linear in
+    their size with a small constant.
+    """
+    if line.startswith(b"<taskprogress"):
+        match = _TASKPROGRESS_RE.match(line)
+    elif b"% done" in line:
+        match = _TIMING_RE.match(line)
+    else:
+        match = None
+    if match is None:
+        return None
+    return float(match.group(2)), match.group(1).decode(errors="replace")
+
+def scan_defaults(args: Sequence[str]) -> List[str]:
+    """
+    Return the default limit and progress options not already present in args.
+    
+    --defeat-rst-ratelimit is only added to scans whose sole scan type is
+    -sS, because nmap refuses it with any other scan type.
+    """
+    defaults = []
+    if HOST_TIMEOUT and not any(a.startswith("--host-timeout") for a in args):
+        defaults.append(f"--host-timeout={HOST_TIMEOUT}")
+    if MAX_RETRIES and not any(a.startswith("--max-retries") for a in args):
+        defaults.append(f"--max-retries={MAX_RETRIES}")
+    if (
+        DEFEAT_RST_RATELIMIT
+        and "--defeat-rst-ratelimit" not in args
+        and _SCAN_TYPE_OPTIONS.intersection(args) == {"-sS"}
+    ):
+        defaults.append("--defeat-rst-ratelimit")
+    if STATS_EVERY and not any(a.startswith("--stats-every") for a in args):
+        defaults.append(f"--stats-every={STATS_EVERY}")
+    return defaults
+
+# Absolute path of the nmap binary, looked up on first use
+_nmap_path: Optional[str] = None
+
+def _nmap_executable() -> str:
+    """Return the absolute path of nmap, or "nmap" if it is not on PATH."""
+    global _nmap_path
+    if _nmap_path is None:
+        _nmap_path = shutil.which("nmap")
+    return _nmap_path or "nmap"
+
+def _cache_path(key: Tuple[str, ...]) -> Path:
+    """Return the on-disk cache file for a command key."""
+    digest = hashlib.sha256("\0".join(key).encode()).hexdigest()
+    return CACHE_DIR / f"{digest}.json"
+
+def _cache_get(key: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    """Return a fresh in-memory cache entry, dropping it if it has expired."""
+    entry = _result_cache.get(key)
+    if entry is None:
+        return None
+    created, result = entry
+    if time.time() - created > CACHE_TTL:
+        del _result_cache[key]
+        return None
+    _result_cache.move_to_end(key)
+    return result
+
+def _cache_put(key: Tuple[str, ...], result: Dict[str, Any], created: float) -> None:
+    """Store a result in the in-memory cache, evicting the least recently used."""
+    _result_cache[key] = (created, result)
+    _result_cache.move_to_end(key)
+    while len(_result_cache) > CACHE_SIZE:
+        _result_cache.popitem(last=False)
+
+def _cache_load(key: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    """Load a fresh result from the on-disk cache into memory, deleting it if expired."""
+    path = _cache_path(key)
+    try:
+        entry = json.loads(path.read_text())
+        if entry["args"] != list(key):
+            return None
+        created = float(entry["created"])
+        result = {**entry["result"], "created": created}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        # Unreadable or malformed entries count as a miss
+        return None
+    if time.time() - created > CACHE_TTL:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+        return None
+    _cache_put(key, result, created)
+    return result
+
+# When CACHE_DIR was last swept for expired files
+_last_prune = 0.0
+
+def _cache_prune(now: float) -> None:
+    """Delete on-disk cache files older than CACHE_TTL."""
+    global _last_prune
+    _last_prune = now
+    for path in CACHE_DIR.glob("*.json"):
+        try:
+            if now - path.stat().st_mtime > CACHE_TTL:
+                path.unlink()
+        except OSError:
+            pass
+
+def _cache_save(key: Tuple[str, ...], result: Dict[str, Any], created: float) -> None:
+    """Persist a result to the on-disk cache, ignoring filesystem errors."""
+    try:
+        CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        entry = {"created": created, "args": list(key), "result": result}
+        _cache_path(key).write_text(json.dumps(entry))
+    except OSError as e:
+        logger.warning("Could not write scan cache: %s", e)
+    if created - _last_prune > CACHE_TTL:
+        _cache_prune(created)
+
+def _port_set(spec: str) -> Optional[frozenset]:
+    """Expand a numeric port specification such as "22,80,1000-2000"."""
+    if spec == "-":
+        return frozenset(range(1, 65536))
+    ports = set()
+    for part in spec.split(","):
+        low, _, high = part.partition("-")
+        if not low.isdigit() or (high and not high.isdigit()):
+            return None
+        first, last = int(low), int(high or low)
+        # Leave invalid ranges to nmap so the caller gets its error
+        if not 0 <= first <= last <= 65535:
+            return None
+        ports.update(range(first, last + 1))
+    return frozenset(ports)
+
+def _split_port_arg(key: Tuple[str, ...]) -> Optional[Tuple[Tuple[str, ...], frozenset]]:
+    """Split a command key into its arguments without -p and the requested ports."""
+    if "-p" not in key[:-1]:
+        return None
+    index = key.index("-p")
+    ports = _port_set(key[index + 1])
+    if ports is None:
+        return None
+    return key[:index] + key[index + 2:], ports
+
+def _cache_get_subset(key: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    """
+    Answer a scan from a cached scan of a superset of its ports.
+    
+    A cached entry qualifies when every argument except the -p value is
+    identical and its port list covers the requested one; its hosts are
+    returned with the port list narrowed to the requested ports. Scans where
+    nmap folded ports into <extraports> are skipped, since the requested
+    ports may be among those not listed individually.
+    """
+    split = _split_port_arg(key)
+    if split is None:
+        return None
+    rest, wanted = split
+    
+    for cached_key in list(reversed(_result_cache)):
+        cached_split = _split_port_arg(cached_key)
+        if cached_split is None or cached_split[0] != rest or not wanted <= cached_split[1]:
+            continue
+        cached = _cache_get(cached_key)
+        if cached is None or "scan" not in cached:
+            continue
+        if any("extraports" in host for host in cached["scan"]["hosts"]):
+            continue
+        scan = dict(cached["scan"])
+        scan["hosts"] = [
+            {**host, "ports": [p for p in host.get("ports", []) if p["port"] in wanted]}
+            for host in scan["hosts"]
+        ]
+        return {**cached, "scan": scan, "stdout": _dump_scan(scan)}
+    return None
+
+def _dump_scan(scan: Dict[str, Any]) -> str:
+    """Serialize a parsed scan as compact JSON."""
+    return json.dumps(scan, separators=(",", ":"))
+
+def _parse_host(host: Any) -> Dict[str, Any]:
+    """Convert one <host> element into a compact dictionary."""
+    entry: Dict[str, Any] = {}
+    for address in host.findall("address"):
+        if address.get("addrtype") == "mac":
+            entry["mac"] = address.get("addr")
+        else:
+            entry.setdefault("ip", address.get("addr"))
+    
+    status = host.find("status")
+    if status is not None:
+        entry["status"] = status.get("state")
+    
+    hostnames = [h.get("name") for h in host.findall("hostnames/hostname")]
+    if hostnames:
+        entry["hostnames"] = hostnames
+    
+    ports = []
+    for port in host.findall("ports/port"):
+        item: Dict[str, Any] = {"port": int(port.get("portid")), "proto": port.get("protocol")}
+        state = port.find("state")
+        if state is not None:
+            item["state"] = state.get("state")
+        service = port.find("service")
+        if service is not None:
+            item["service"] = service.get("name")
+            version = " ".join(
+                filter(None, (service.get(k) for k in ("product", "version", "extrainfo")))
+            )
+            if version:
+                item["version"] = version
+        scripts = {s.get("id"): s.get("output") for s in port.findall("script")}
+        if scripts:
+            item["scripts"] = scripts
+        ports.append(item)
+    if ports:
+        entry["ports"] = ports
+    
+    # Ports nmap did not list one by one, e.g. {"closed": 65530}
+    extraports = {
+        e.get("state"): int(e.get("count", 0)) for e in host.findall("ports/extraports")
+    }
+    if extraports:
+        entry["extraports"] = extraports
+    
+    os_matches = [
+        {"name": m.get("name"), "accuracy": int(m.get("accuracy", 0))}
+        for m in host.findall("os/osmatch")[:3]
+    ]
+    if os_matches:
+        entry["os"] = os_matches
+    
+    host_scripts = {s.get("id"): s.get("output") for s in host.findall("hostscript/script")}
+    if host_scripts:
+        entry["scripts"] = host_scripts
+    
+    return entry
+
+def parse_nmap_xml(source: Any) -> Dict[str, Any]:
+    """
+    Convert nmap XML output into a compact dictionary.
+    
+    The document is parsed incrementally with iterparse and each <host> is
+    removed from the tree once converted, so the parse tree holds about one
+    host at a time (the returned dictionary still grows with the scan).
+    lxml is used when installed, the stdlib parser otherwise.
+    
+    Args:
+        source: Binary file-like object (file, mmap) holding nmap -oX output
+    
+    Returns:
+        Dictionary of the form {"hosts": [{"ip", "status", "ports", ...}], "stats": {...}}
+        with empty fields omitted
+    """
+    if _HAS_LXML:
+        events = ET.iterparse(source, events=("end",), tag=("host", "hosts"))
+    else:
+        # The stdlib parser has no getparent(); the start event yields the root
+        events = ET.iterparse(source, events=("start", "end"))
+    
+    scan: Dict[str, Any] = {"hosts": []}
+    root = None
+    for event, elem in events:
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+        if elem.tag == "host":
+            scan["hosts"].append(_parse_host(elem))
+            # Detach converted hosts so the tree does not keep every one of them
+            elem.clear()
+            if _HAS_LXML:
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+            else:
+                root.remove(elem)
+        elif elem.tag == "hosts":
+            scan["stats"] = {k: int(elem.get(k, 0)) for k in ("up", "down", "total")}
+    return scan
+
+# XML results are written to a RAM-backed directory when the system has one
+XML_OUTPUT_DIR = "/dev/shm" if os.access("/dev/shm", os.W_OK) else tempfile.gettempdir()
+
+def _read_xml_output(path: str) -> Dict[str, Any]:
+    """
+    Parse an nmap XML output file through a read-only memory map.
+    
+    The parser reads straight from the page cache, so the document is never
+    copied through a pipe or held as one large bytes object.
+    
+    Raises:
+        ET.ParseError: If the file is empty or not valid nmap XML
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files cannot be mapped; let the parser report the error
+            return parse_nmap_xml(f)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return parse_nmap_xml(mm)
+
+async def run_nmap_command(
+    args: Sequence[str],
+    timeout: int = 300,
+    ctx: Optional[Context] = None,
+    targets: Sequence[str] = ()
+) -> Dict[str, Any]:
+    """
+    Execute an nmap command, reusing a cached result when one is available.
+    
+    Unless overridden, every scan gets a host timeout and a retransmission
+    cap, and SYN scans also get --defeat-rst-ratelimit (see scan_defaults),
+    so one unresponsive host cannot hold a concurrency slot for minutes.
+    
+    Hostnames are resolved by the server before nmap runs, so -n is added
+    unless the arguments request reverse DNS with -R. Unless the arguments
+    already choose an output (-o*), nmap writes XML to a temporary file
+    under XML_OUTPUT_DIR and the result's "stdout" holds compact JSON built
+    from it (the parsed form is kept under "scan"); nmap's normal output is
+    then only streamed to the client, not kept.
+    
+    Successful results are kept in an in-memory LRU and under CACHE_DIR for
+    CACHE_TTL seconds, keyed by the exact argument list, so repeating a scan
+    within that window does not start nmap again. A scan of a subset of the
+    ports of a cached scan is answered from that scan. A call identical to
+    a scan that is still running waits for that scan instead of starting
+    another nmap process.
+    
+    Args:
+        args: Sequence of nmap command arguments
+        timeout: Command timeout in seconds
+        ctx: Optional MCP context used to stream output to the client
+        targets: The scan's target arguments; IPs among them that the scan
+            does not report up are recorded as down (see _record_host_status)
+    
+    Returns:
+        Dictionary containing command output, error, and exit code
+    """
+    args = [*scan_defaults(args), *args]
+    
+    # Targets arrive pre-resolved, so skip nmap's own DNS unless -R was asked for
+    if "-R" not in args and "-n" not in args:
+        args = list(args) + ["-n"]
+    
+    # In the key, "-oX -" stands for the temporary file used by _run_and_cache
+    xml_output = not any(arg.startswith("-o") for arg in args)
+    if xml_output:
+        args = list(args) + ["-oX", "-"]
+    key = tuple(args)
+    
+    if CACHE_TTL > 0:
+        cached = (
+            _cache_get(key)
+            or await asyncio.to_thread(_cache_load, key)
+            or _cache_get_subset(key)
+        )
+        if cached is not None:
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Using cached result for: nmap %s", " ".join(args))
+            return {**cached, "cached_age": time.time() - cached["created"]}
+    
+    task = _inflight_scans.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_run_and_cache(key, timeout, ctx, xml_output, targets))
+        _inflight_scans[key] = task
+        task.add_done_callback(lambda _: _inflight_scans.pop(key, None))
+    elif logger.isEnabledFor(logging.INFO):
+        logger.info("Joining running scan: nmap %s", " ".join(args))
+    
+    # Shielded so one caller giving up does not cancel the scan for the others
+    return await asyncio.shield(task)
+
+async def _run_and_cache(
+    key: Tuple[str, ...],
+    timeout: int,
+    ctx: Optional[Context],
+    xml_output: bool,
+    targets: Sequence[str] = ()
+) -> Dict[str, Any]:
+    """Run a prepared nmap command, convert its XML output and cache the result."""
+    if not xml_output:
+        result = await _execute_nmap(key, timeout, ctx)
+    else:
+        # nmap creates the file with the process umask, so it goes into a
+        # private (0700) directory to keep results from other local users
+        with tempfile.TemporaryDirectory(prefix="nmap-", dir=XML_OUTPUT_DIR) as xml_dir:
+            xml_path = os.path.join(xml_dir, "scan.xml")
+            result = await _execute_nmap(
+                (*key[:-1], xml_path), timeout, ctx, capture_stdout=False
+            )
+            if result["success"]:
+                try:
+                    result["scan"] = _read_xml_output(xml_path)
+                    result["stdout"] = _dump_scan(result["scan"])
+                    _record_host_status(key, targets, result["scan"])
+                except (OSError, ET.ParseError) as e:
+                    logger.warning("Could not parse nmap XML output: %s", e)
+                    result["success"] = False
+                    result["stderr"] += f"\nCould not parse nmap XML output: {e}"
+    
+    if result["success"] and CACHE_TTL > 0:
+        created = result["created"] = time.time()
+        _cache_put(key, result, created)
+        await asyncio.to_thread(_cache_save, key, result, created)
+    
+    return result
+
+async def _notify(send: Any, *args: Any, **kwargs: Any) -> None:
+    """Send a client notification, dropping failures such as a disconnected client."""
+    try:
+        await send(*args, **kwargs)
+    except Exception as e:
+        logger.debug("Dropped client notification: %s", e)
+
+async def _execute_nmap(
+    args: Sequence[str],
+    timeout: int = 300,
+    ctx: Optional[Context] = None,
+    capture_stdout: bool = True
+) -> Dict[str, Any]:
     """
     Execute an nmap command and return the results.
     
+    The scan runs as an asyncio subprocess so the event loop keeps serving
+    other tool calls while nmap is working. Stdout and stderr are read line
+    by line into buffers and, when a context is given, streamed to the
+    client: stderr lines and normal output as log notifications, nmap's
+    progress reports as progress notifications. A failing notification is
+    dropped rather than aborting the scan, which other callers may share.
+    At most MAX_CONCURRENT_SCANS nmap processes run at once; further calls
+    wait for a free slot.
+    
+    nmap is started by absolute path with close_fds=False and no
+    preexec_fn, cwd or session changes, which lets CPython create the child
+    with posix_spawn instead of fork + exec. Python's own descriptors are
+    non-inheritable (PEP 446), so nothing leaks into the child.
+    
     Args:
-        args: List of nmap command arguments
+        args: Sequence of nmap command arguments
         timeout: Command timeout in seconds
+        ctx: Optional MCP context used to stream output to the client
+        capture_stdout: Keep stdout for the result; when False it is only
+            streamed to the client
     
     Returns:
         Dictionary containing command output, error, and exit code
     """
     try:
         # Construct the full nmap command
-        cmd = ["nmap"] + args
+        cmd = [_nmap_executable(), *args]
         
-        logger.info(f"Executing nmap command: {' '.join(cmd)}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Executing nmap command: %s", " ".join(cmd))
         
-        # Run the command with timeout
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            check=False
-        )
+        async with _SCAN_SEM:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                close_fds=False
+            )
+            
+            stdout = bytearray()
+            stderr = bytearray()
+            
+            async def read_stdout() -> None:
+                async for line in proc.stdout:
+                    if capture_stdout:
+                        stdout.extend(line)
+                    if ctx is None or not line.strip():
+                        continue
+                    await _notify(ctx.info, line.decode(errors="replace").rstrip())
+                    progress = parse_progress(line)
+                    if progress is not None:
+                        await _notify(
+                            ctx.report_progress, progress[0], 100, message=progress[1]
+                        )
+            
+            async def read_stderr() -> None:
+                async for line in proc.stderr:
+                    stderr.extend(line)
+                    if ctx is not None and line.strip():
+                        await _notify(
+                            ctx.log, "warning", line.decode(errors="replace").rstrip()
+                        )
+            
+            # Run the command with timeout
+            io = asyncio.gather(read_stdout(), read_stderr(), proc.wait())
+            try:
+                await asyncio.wait_for(io, timeout)
+            except asyncio.TimeoutError:
+                return {
+                    "stdout": "",
+                    "stderr": f"Command timed out after {timeout} seconds",
+                    "exit_code": -1,
+                    "success": False
+                }
+            finally:
+                # Whatever ended the wait (timeout, error, cancellation), never
+                # leave nmap running after its concurrency slot is released
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+                await asyncio.gather(io, return_exceptions=True)
+            
+            return {
+                "stdout": stdout.decode(errors="replace"),
+                "stderr": stderr.decode(errors="replace"),
+                "exit_code": proc.returncode,
+                "success": proc.returncode == 0
+            }
         
-        return {
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "exit_code": result.returncode,
-            "success": result.returncode == 0
-        }
-        
-    except subprocess.TimeoutExpired:
-        return {
-            "stdout": "",
-            "stderr": f"Command timed out after {timeout} seconds",
-            "exit_code": -1,
-            "success": False
-        }
     except FileNotFoundError:
         return {
             "stdout": "",
@@ -90,263 +623,842 @@ def run_nmap_command(args: List[str], timeout: int = 300) -> Dict[str, Any]:
             "success": False
         }
 
+_HOSTNAME_RE = re.compile(r"^(?=.*[A-Za-z])[A-Za-z0-9._-]+$")
+
+def _is_ip(token: str) -> bool:
+    """Return True if a target token is a single IPv4 or IPv6 address."""
+    try:
+        ipaddress.ip_address(token)
+        return True
+    except ValueError:
+        return False
+
+def _is_hostname(token: str) -> bool:
+    """Return True if a target token is a DNS name rather than an IP, CIDR or range."""
+    if _is_ip(token):
+        return False
+    return bool(_HOSTNAME_RE.match(token)) and not token.startswith("-")
+
+# Forward DNS answers are reused for DNS_TTL seconds across tool calls
+DNS_TTL = int(os.getenv("NMAP_DNS_TTL", 300))
+_dns_cache: Dict[Tuple[str, int], Tuple[float, str]] = {}
+
+async def _resolve_host(host: str, family: int = socket.AF_INET) -> Optional[str]:
+    """Resolve a hostname to an address of family, using the in-process DNS cache."""
+    entry = _dns_cache.get((host, family))
+    if entry is not None and time.time() - entry[0] <= DNS_TTL:
+        return entry[1]
+    
+    loop = asyncio.get_running_loop()
+    try:
+        infos = await loop.getaddrinfo(host, None, family=family)
+    except OSError:
+        return None
+    if not infos:
+        return None
+    
+    ip = infos[0][4][0]
+    _dns_cache[(host, family)] = (time.time(), ip)
+    return ip
+
+def _split_host_list(token: str) -> List[str]:
+    """
+    Split a comma separated list of hostnames and IPs into its entries.
+    
+    Commas in nmap octet ranges (192.168.3-5,7.1) are part of the target,
+    so any token with an entry that is not a hostname or IP is kept whole.
+    """
+    parts = token.split(",")
+    if len(parts) > 1 and all(_is_hostname(p) or _is_ip(p) for p in parts):
+        return parts
+    return [token]
+
+async def _dedupe_targets(
+    target_str: str,
+    family: int = socket.AF_INET
+) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Split a target string and collapse hostnames that resolve to the same IP.
+    
+    Nmap scans an address once per hostname that points at it, so hostnames
+    are resolved concurrently up front (through the DNS cache) and replaced
+    by their address (IPv4 unless family says otherwise). IPs, CIDR blocks, ranges and names that fail to
+    resolve are passed through unchanged.
+    
+    Args:
+        target_str: Whitespace separated nmap target specification; a
+            comma separated list of hostnames and IPs is split as well
+        family: Address family to resolve hostnames to (AF_INET6 for -6 scans)
+    
+    Returns:
+        Tuple of the unique target arguments and a mapping of each resolved
+        IP to the hostnames that pointed at it
+    
+    Raises:
+        ValueError: If a target starts with "-"
+    """
+    tokens = [part for token in target_str.split() for part in _split_host_list(token)]
+    # Each token becomes its own argument, so one starting with "-" would be
+    # read by nmap as an option and bypass the custom option allowlist
+    for token in tokens:
+        if token.startswith("-"):
+            raise ValueError(f"Invalid target (looks like an nmap option): {token}")
+    hostnames = list(dict.fromkeys(token for token in tokens if _is_hostname(token)))
+    
+    resolved = await asyncio.gather(*(_resolve_host(host, family) for host in hostnames))
+    addresses = {host: ip for host, ip in zip(hostnames, resolved) if ip is not None}
+    
+    host_groups: Dict[str, List[str]] = {}
+    for host, ip in addresses.items():
+        host_groups.setdefault(ip, []).append(host)
+    
+    unique_targets = list(dict.fromkeys(addresses.get(token, token) for token in tokens))
+    return unique_targets, host_groups
+
+def _canonical_ip(token: str) -> Optional[str]:
+    """Return the canonical text of an IP address (2001:DB8::1 -> 2001:db8::1), or None."""
+    try:
+        return str(ipaddress.ip_address(token))
+    except ValueError:
+        return None
+
+def _record_host_status(
+    args: Sequence[str],
+    targets: Sequence[str],
+    scan: Dict[str, Any]
+) -> None:
+    """
+    Remember the status of every host a completed scan covered.
+    
+    Only "up" and "down" are recorded; list scans report "unknown". Without
+    -v nmap leaves down hosts out of its XML, so after a scan that did host
+    discovery (no -sL or -Pn) an IP given explicitly in targets that is not
+    reported up is recorded as down. Only the targets are considered, never
+    other option values such as -S, -D or --dns-servers addresses.
+    """
+    now = time.time()
+    up = set()
+    for host in scan["hosts"]:
+        ip = _canonical_ip(host.get("ip", ""))
+        status = host.get("status")
+        if ip is None or status not in ("up", "down"):
+            continue
+        _host_status[ip] = (now, status)
+        if status == "up":
+            up.add(ip)
+    
+    if "-sL" in args or "-Pn" in args:
+        return
+    for target in targets:
+        ip = _canonical_ip(target)
+        if ip is not None and ip not in up:
+            _host_status[ip] = (now, "down")
+
+def _is_known_down(ip: str, ttl: int = DOWN_TTL) -> bool:
+    """Return True if a scan within the last ttl seconds found ip down."""
+    entry = _host_status.get(_canonical_ip(ip) or ip)
+    return entry is not None and entry[1] == "down" and time.time() - entry[0] <= ttl
+
+def split_known_down(targets: List[str]) -> Tuple[List[str], List[str]]:
+    """Split target arguments into those still worth scanning and known-down IPs."""
+    live = [t for t in targets if not _is_known_down(t)]
+    down = [t for t in targets if _is_known_down(t)]
+    return live, down
+
+def format_known_down(down: List[str]) -> str:
+    """Render the targets skipped because a recent scan found them down."""
+    if not down:
+        return ""
+    return (
+        f"Skipped (host down in a scan within the last {DOWN_TTL}s):\n"
+        + "\n".join(f"  {ip}" for ip in down)
+    )
+
+def format_host_groups(host_groups: Dict[str, List[str]]) -> str:
+    """Render the IP to hostname mapping produced by _dedupe_targets."""
+    if not host_groups:
+        return ""
+    lines = [f"  {ip}: {', '.join(names)}" for ip, names in host_groups.items()]
+    return "Resolved targets:\n" + "\n".join(lines)
+
+def cache_note(result: Dict[str, Any]) -> str:
+    """Say how old a result served from the cache is, or "" for a fresh scan."""
+    if "cached_age" not in result:
+        return ""
+    return f"(cached, {int(result['cached_age'])} s old)"
+
+def text_blocks(*texts: str) -> List[TextContent]:
+    """
+    Wrap each non-empty text in its own TextContent block.
+    
+    Tools return the header and the scan output as separate blocks, so the
+    (possibly large) output string is passed through without being copied
+    into a concatenated message.
+    """
+    return [TextContent(type="text", text=text) for text in texts if text]
+
+# Fixed nmap arguments for each (tool, mode); tools only add ports, their
+# own parameters and targets, so equivalent calls build identical commands
+PRESETS: Dict[Tuple[str, str], Tuple[str, ...]] = {
+    ("basic", "quick"): ("-T4", "--min-rate=1000"),
+    ("basic", "comprehensive"): ("-sS", "-sV", "-O", "--script=default"),
+    ("basic", "stealth"): ("-sS", "-T2", "--min-rate=100"),
+    ("service", "default"): ("-sV",),
+    ("os", "default"): ("-O",),
+    ("stealth", "default"): ("-sS",),
+    ("comprehensive", "plain"): ("-sS", "-sV", "-O"),
+    ("comprehensive", "scripts"): ("-sS", "-sV", "-O", "--script=default"),
+    ("ping", "icmp"): ("-sn", "-PE"),
+    ("ping", "tcp"): ("-sn", "-PS"),
+    ("ping", "both"): ("-sn", "-PE", "-PS"),
+    ("port", "syn"): ("-sS",),
+    ("port", "connect"): ("-sT",),
+    ("port", "udp"): ("-sU",),
+    ("discovery", "ping"): (),
+    ("discovery", "arp"): ("-PR",),
+    ("discovery", "syn"): ("-PS",),
+    ("discovery", "all"): ("-PS", "-PA"),
+    ("discovery", "hosts_only"): ("-sn",),
+    ("discovery", "with_ports"): ("-sS", "-sV", "--top-ports=100"),
+}
+
+def preset(tool: str, mode: str, fallback: str) -> Tuple[str, ...]:
+    """Look up the preset for (tool, mode), using fallback for unknown modes."""
+    return PRESETS.get((tool, mode), PRESETS[(tool, fallback)])
+
+def port_args(ports: str) -> Tuple[str, ...]:
+    """
+    Translate a tool's ports parameter into nmap arguments.
+    
+    "common" leaves the choice to nmap (its top 1000 ports), "all" scans
+    every port and anything else is passed to -p as a port list.
+    """
+    if ports == "common":
+        return ()
+    if ports == "all":
+        return ("-p", "-")
+    return ("-p", ports)
+
+# NSE script names, categories and boolean expressions of them. Paths are
+# not accepted, so no local .nse/.lua file can be loaded
+_SCRIPT_SPEC_RE = re.compile(r"^[\w\s,()*+-]+$")
+
+def script_arg(spec: str) -> str:
+    """
+    Build a --script argument for an NSE script specification.
+    
+    Raises:
+        ValueError: If spec is not made of script names and categories
+    """
+    if not _SCRIPT_SPEC_RE.match(spec):
+        raise ValueError(f"Unsupported script specification: {spec}")
+    return f"--script={spec}"
+
+def basic_scan_args(ports: str, scan_type: str) -> Tuple[str, ...]:
+    """Build the nmap arguments for a basic scan, without the targets."""
+    return (*PRESETS.get(("basic", scan_type), ()), *port_args(ports))
+
 @app.tool(
     name="nmap_basic_scan",
-    description="Perform a basic Nmap scan of specified targets"
+    description="Perform a basic Nmap scan of specified targets",
+    structured_output=False
 )
 async def nmap_basic_scan(
     targets: str,
     ports: str = "common",
-    scan_type: str = "quick"
-) -> str:
+    scan_type: str = "quick",
+    ctx: Context = None
+) -> List[TextContent]:
     """Perform a basic Nmap scan of specified targets."""
-    args = ["-p", ports]
-    
-    if scan_type == "quick":
-        args.extend(["-T4", "--min-rate=1000"])
-    elif scan_type == "comprehensive":
-        args.extend(["-sS", "-sV", "-O", "--script=default"])
-    elif scan_type == "stealth":
-        args.extend(["-sS", "-T2", "--min-rate=100"])
+    try:
+        target_args, host_groups = await _dedupe_targets(targets)
+    except ValueError as e:
+        return text_blocks("Basic scan failed", str(e))
     
-    args.append(targets)
+    args = (*basic_scan_args(ports, scan_type), *target_args)
     
-    result = run_nmap_command(args)
+    result = await run_nmap_command(args, ctx=ctx, targets=target_args)
     
     if result["success"]:
-        return f"Basic scan completed successfully:\n\n{result['stdout']}"
+        return text_blocks(
+            "Basic scan completed successfully",
+            format_host_groups(host_groups),
+            cache_note(result),
+            result["stdout"]
+        )
     else:
-        return f"Basic scan failed:\n\n{result['stderr']}"
+        return text_blocks("Basic scan failed", result["stderr"])
 
 @app.tool(
     name="nmap_service_detection",
-    description="Perform service and version detection scan"
+    description="Perform service and version detection scan",
+    structured_output=False
 )
 async def nmap_service_detection(
     targets: str,
     ports: str = "common",
-    intensity: int = 7
-) -> str:
+    intensity: int = 7,
+    ctx: Context = None
+) -> List[TextContent]:
     """Perform service and version detection scan."""
-    args = ["-sV", f"--version-intensity={intensity}", "-p", ports, targets]
+    try:
+        target_args, host_groups = await _dedupe_targets(targets)
+    except ValueError as e:
+        return text_blocks("Service detection scan failed", str(e))
+    
+    target_args, down = split_known_down(target_args)
+    if not target_args:
+        return text_blocks("Service detection scan skipped", format_known_down(down))
     
-    result = run_nmap_command(args)
+    args = (
+        *PRESETS[("service", "default")],
+        f"--version-intensity={intensity}",
+        *port_args(ports),
+        *target_args
+    )
+    
+    result = await run_nmap_command(args, ctx=ctx, targets=target_args)
     
     if result["success"]:
-        return f"Service detection scan completed:\n\n{result['stdout']}"
+        return text_blocks(
+            "Service detection scan completed",
+            format_host_groups(host_groups),
+            format_known_down(down),
+            cache_note(result),
+            result["stdout"]
+        )
     else:
-        return f"Service detection scan failed:\n\n{result['stderr']}"
+        return text_blocks("Service detection scan failed", result["stderr"])
 
 @app.tool(
     name="nmap_os_detection",
-    description="Perform operating system detection scan"
+    description="Perform operating system detection scan",
+    structured_output=False
 )
 async def nmap_os_detection(
     targets: str,
     ports: str = "common",
-    max_retries: int = 2
-) -> str:
+    max_retries: int = 2,
+    ctx: Context = None
+) -> List[TextContent]:
     """Perform operating system detection scan."""
-    args = ["-O", f"--osscan-retries={max_retries}", "-p", ports, targets]
+    try:
+        target_args, host_groups = await _dedupe_targets(targets)
+    except ValueError as e:
+        return text_blocks("OS detection scan failed", str(e))
     
-    result = run_nmap_command(args)
+    target_args, down = split_known_down(target_args)
+    if not target_args:
+        return text_blocks("OS detection scan skipped", format_known_down(down))
+    
+    args = (
+        *PRESETS[("os", "default")],
+        f"--max-os-tries={max_retries}",
+        *port_args(ports),
+        *target_args
+    )
+    
+    result = await run_nmap_command(args, ctx=ctx, targets=target_args)
     
     if result["success"]:
-        return f"OS detection scan completed:\n\n{result['stdout']}"
+        return text_blocks(
+            "OS detection scan completed",
+            format_host_groups(host_groups),
+            format_known_down(down),
+            cache_note(result),
+            result["stdout"]
+        )
     else:
-        return f"OS detection scan failed:\n\n{result['stderr']}"
+        return text_blocks("OS detection scan failed", result["stderr"])
 
 @app.tool(
     name="nmap_script_scan",
-    description="Run NSE (Nmap Scripting Engine) scripts"
+    description="Run NSE (Nmap Scripting Engine) scripts",
+    structured_output=False
 )
 async def nmap_script_scan(
     targets: str,
     scripts: str = "default",
-    ports: str = "common"
-) -> str:
+    ports: str = "common",
+    ctx: Context = None
+) -> List[TextContent]:
     """Run NSE (Nmap Scripting Engine) scripts."""
-    args = [f"--script={scripts}", "-p", ports, targets]
+    try:
+        target_args, host_groups = await _dedupe_targets(targets)
+    except ValueError as e:
+        return text_blocks("NSE script scan failed", str(e))
+    
+    try:
+        args = (script_arg(scripts), *port_args(ports), *target_args)
+    except ValueError as e:
+        return text_blocks("NSE script scan failed", str(e))
     
-    result = run_nmap_command(args)
+    result = await run_nmap_command(args, ctx=ctx, targets=target_args)
     
     if result["success"]:
-        return f"NSE script scan completed:\n\n{result['stdout']}"
+        return text_blocks(
+            "NSE script scan completed",
+            format_host_groups(host_groups),
+            cache_note(result),
+            result["stdout"]
+        )
     else:
-        return f"NSE script scan failed:\n\n{result['stderr']}"
+        return text_blocks("NSE script scan failed", result["stderr"])
 
 @app.tool(
     name="nmap_stealth_scan",
-    description="Perform stealth scan (SYN scan) with minimal detection"
+    description="Perform stealth scan (SYN scan) with minimal detection",
+    structured_output=False
 )
 async def nmap_stealth_scan(
     targets: str,
     ports: str = "common",
-    timing: int = 3
-) -> str:
+    timing: int = 3,
+    ctx: Context = None
+) -> List[TextContent]:
     """Perform stealth scan (SYN scan) with minimal detection."""
-    args = ["-sS", f"-T{timing}", "-p", ports, targets]
+    try:
+        target_args, host_groups = await _dedupe_targets(targets)
+    except ValueError as e:
+        return text_blocks("Stealth scan failed", str(e))
     
-    result = run_nmap_command(args)
+    args = (*PRESETS[("stealth", "default")], f"-T{timing}", *port_args(ports), *target_args)
+    
+    result = await run_nmap_command(args, ctx=ctx, targets=target_args)
     
     if result["success"]:
-        return f"Stealth scan completed:\n\n{result['stdout']}"
+        return text_blocks(
+            "Stealth scan completed",
+            format_host_groups(host_groups),
+            cache_note(result),
+            result["stdout"]
+        )
     else:
-        return f"Stealth scan failed:\n\n{result['stderr']}"
+        return text_blocks("Stealth scan failed", result["stderr"])
 
 @app.tool(
     name="nmap_comprehensive_scan",
-    description="Perform comprehensive scan with all detection methods"
+    description="Perform comprehensive scan with all detection methods",
+    structured_output=False
 )
 async def nmap_comprehensive_scan(
     targets: str,
     ports: str = "all",
-    include_scripts: bool = True
-) -> str:
+    include_scripts: bool = True,
+    ctx: Context = None
+) -> List[TextContent]:
     """Perform comprehensive scan with all detection methods."""
-    args = ["-sS", "-sV", "-O", "-p", ports]
-    
-    if include_scripts:
-        args.append("--script=default")
+    try:
+        target_args, host_groups = await _dedupe_targets(targets)
+    except ValueError as e:
+        return text_blocks("Comprehensive scan failed", str(e))
     
-    args.append(targets)
+    mode = "scripts" if include_scripts else "plain"
+    args = (*PRESETS[("comprehensive", mode)], *port_args(ports), *target_args)
     
-    result = run_nmap_command(args, timeout=600)  # Longer timeout for comprehensive scan
+    # Longer timeout for comprehensive scan
+    result = await run_nmap_command(args, timeout=600, ctx=ctx, targets=target_args)
     
     if result["success"]:
-        return f"Comprehensive scan completed:\n\n{result['stdout']}"
+        return text_blocks(
+            "Comprehensive scan completed",
+            format_host_groups(host_groups),
+            cache_note(result),
+            result["stdout"]
+        )
     else:
-        return f"Comprehensive scan failed:\n\n{result['stderr']}"
+        return text_blocks("Comprehensive scan failed", result["stderr"])
 
 @app.tool(
     name="nmap_ping_scan",
-    description="Perform ping scan to discover live hosts"
+    description="Perform ping scan to discover live hosts",
+    structured_output=False
 )
 async def nmap_ping_scan(
     targets: str,
-    ping_type: str = "both"
-) -> str:
+    ping_type: str = "both",
+    ctx: Context = None
+) -> List[TextContent]:
     """Perform ping scan to discover live hosts."""
-    if ping_type == "icmp":
-        args = ["-sn", targets]
-    elif ping_type == "tcp":
-        args = ["-PS", targets]
-    else:  # both
-        args = ["-sn", "-PS", targets]
+    try:
+        target_args, host_groups = await _dedupe_targets(targets)
+    except ValueError as e:
+        return text_blocks("Ping scan failed", str(e))
+    
+    args = (*preset("ping", ping_type, "both"), *target_args)
     
-    result = run_nmap_command(args)
+    result = await run_nmap_command(args, ctx=ctx, targets=target_args)
     
     if result["success"]:
-        return f"Ping scan completed:\n\n{result['stdout']}"
+        return text_blocks(
+            "Ping scan completed",
+            format_host_groups(host_groups),
+            cache_note(result),
+            result["stdout"]
+        )
     else:
-        return f"Ping scan failed:\n\n{result['stderr']}"
+        return text_blocks("Ping scan failed", result["stderr"])
 
 @app.tool(
     name="nmap_port_scan",
-    description="Scan specific ports on target hosts"
+    description="Scan specific ports on target hosts",
+    structured_output=False
 )
 async def nmap_port_scan(
     targets: str,
     ports: str,
-    scan_method: str = "syn"
-) -> str:
+    scan_method: str = "syn",
+    ctx: Context = None
+) -> List[TextContent]:
     """Scan specific ports on target hosts."""
-    if scan_method == "syn":
-        args = ["-sS", "-p", ports, targets]
-    elif scan_method == "connect":
-        args = ["-sT", "-p", ports, targets]
-    else:  # udp
-        args = ["-sU", "-p", ports, targets]
+    try:
+        target_args, host_groups = await _dedupe_targets(targets)
+    except ValueError as e:
+        return text_blocks("Port scan failed", str(e))
     
-    result = run_nmap_command(args)
+    args = (*preset("port", scan_method, "udp"), *port_args(ports), *target_args)
+    
+    result = await run_nmap_command(args, ctx=ctx, targets=target_args)
     
     if result["success"]:
-        return f"Port scan completed:\n\n{result['stdout']}"
+        return text_blocks(
+            "Port scan completed",
+            format_host_groups(host_groups),
+            cache_note(result),
+            result["stdout"]
+        )
     else:
-        return f"Port scan failed:\n\n{result['stderr']}"
+        return text_blocks("Port scan failed", result["stderr"])
 
 @app.tool(
     name="nmap_vulnerability_scan",
-    description="Run vulnerability detection scripts"
+    description="Run vulnerability detection scripts",
+    structured_output=False
 )
 async def nmap_vulnerability_scan(
     targets: str,
     ports: str = "common",
-    vuln_category: str = "all"
-) -> str:
+    vuln_category: str = "all",
+    ctx: Context = None
+) -> List[TextContent]:
     """Run vulnerability detection scripts."""
+    try:
+        target_args, host_groups = await _dedupe_targets(targets)
+    except ValueError as e:
+        return text_blocks("Vulnerability scan failed", str(e))
+    
+    target_args, down = split_known_down(target_args)
+    if not target_args:
+        return text_blocks("Vulnerability scan skipped", format_known_down(down))
+    
     if vuln_category == "all":
         scripts = "vuln"
     else:
         scripts = f"vuln and {vuln_category}"
     
-    args = [f"--script={scripts}", "-p", ports, targets]
+    try:
+        args = (script_arg(scripts), *port_args(ports), *target_args)
+    except ValueError as e:
+        return text_blocks("Vulnerability scan failed", str(e))
     
-    result = run_nmap_command(args, timeout=600)
+    result = await run_nmap_command(args, timeout=600, ctx=ctx, targets=target_args)
     
     if result["success"]:
-        return f"Vulnerability scan completed:\n\n{result['stdout']}"
+        return text_blocks(
+            "Vulnerability scan completed",
+            format_host_groups(host_groups),
+            format_known_down(down),
+            cache_note(result),
+            result["stdout"]
+        )
     else:
-        return f"Vulnerability scan failed:\n\n{result['stderr']}"
+        return text_blocks("Vulnerability scan failed", result["stderr"])
 
 @app.tool(
     name="nmap_network_discovery",
-    description="Discover hosts and services on a network"
+    description="Discover hosts and services on a network",
+    structured_output=False
 )
 async def nmap_network_discovery(
     network: str,
     discovery_method: str = "all",
-    include_ports: bool = True
-) -> str:
+    include_ports: bool = True,
+    ctx: Context = None
+) -> List[TextContent]:
     """Discover hosts and services on a network."""
-    if discovery_method == "ping":
-        args = ["-sn", network]
-    elif discovery_method == "arp":
-        args = ["-PR", network]
-    elif discovery_method == "syn":
-        args = ["-PS", network]
-    else:  # all
-        args = ["-sn", "-PS", "-PA", network]
+    try:
+        target_args, _ = await _dedupe_targets(network)
+    except ValueError as e:
+        return text_blocks("Network discovery failed", str(e))
     
-    if include_ports:
-        args.extend(["-sS", "-sV", "--top-ports=100"])
+    scan_phase = "with_ports" if include_ports else "hosts_only"
+    args = (
+        *preset("discovery", discovery_method, "all"),
+        *PRESETS[("discovery", scan_phase)],
+        *target_args
+    )
     
-    result = run_nmap_command(args)
+    result = await run_nmap_command(args, ctx=ctx, targets=target_args)
     
     if result["success"]:
-        return f"Network discovery completed:\n\n{result['stdout']}"
+        return text_blocks(
+            "Network discovery completed", cache_note(result), result["stdout"]
+        )
     else:
-        return f"Network discovery failed:\n\n{result['stderr']}"
+        return text_blocks("Network discovery failed", result["stderr"])
+
+# Options accepted by nmap_custom_scan. Anything that reads or writes local
+# files (-iL, -oN <file>, --resume, --datadir, ...) is deliberately absent,
+# and --script only takes script names and categories (see script_arg).
+_ALLOWED_OPTIONS = frozenset({
+    "-sS", "-sT", "-sA", "-sW", "-sM", "-sU", "-sN", "-sF", "-sX", "-sY", "-sZ", "-sO",
+    "-sV", "-sC", "-sn", "-sL", "-Pn", "-PE", "-PP", "-PM", "-PR", "-O", "-A", "-F",
+    "-r", "-n", "-R", "-6", "-f", "-e", "-g", "-D", "-S",
+    "-p", "-T", "-PS", "-PA", "-PU", "-PY", "-PO",
+    "--top-ports", "--port-ratio", "--exclude-ports", "--allports", "--exclude",
+    "--min-rate", "--max-rate", "--min-rtt-timeout", "--max-rtt-timeout",
+    "--initial-rtt-timeout", "--max-retries", "--host-timeout", "--scan-delay",
+    "--max-scan-delay", "--min-hostgroup", "--max-hostgroup", "--min-parallelism",
+    "--max-parallelism", "--defeat-rst-ratelimit", "--defeat-icmp-ratelimit",
+    "--version-intensity", "--version-light", "--version-all", "--version-trace",
+    "--osscan-limit", "--osscan-guess", "--max-os-tries", "--script", "--script-args",
+    "--script-trace", "--script-timeout", "--open", "--reason", "--packet-trace",
+    "--traceroute", "--system-dns", "--dns-servers", "--randomize-hosts",
+    "--source-port", "--data-length", "--ttl", "--spoof-mac", "--badsum", "--mtu",
+    "--scanflags", "--disable-arp-ping", "--discovery-ignore-rst", "--stats-every",
+    "--privileged", "--unprivileged",
+})
+# Short options that take their value attached, e.g. -p80, -T4, -PS22, -vv.
+# Values are restricted to what each option accepts, since nmap also reads
+# long options written with a single dash (-datadir, -proxies)
+_ATTACHED_VALUE_RE = re.compile(
+    r"^-(p[\d,:\-\[\]*TUSP]+"
+    r"|T([0-5]|paranoid|sneaky|polite|normal|aggressive|insane)"
+    r"|P[SAUY][\d,\-]*|PO[\d,]*|v+|v\d|d\d*)$"
+)
+_OUTPUT_OPTIONS = frozenset({"-oN", "-oX", "-oG"})
+
+def parse_custom_options(custom_options: str) -> List[str]:
+    """
+    Split user supplied nmap options and check them against the allowlist.
+    
+    Args:
+        custom_options: Option string as typed on an nmap command line
+    
+    Returns:
+        List of nmap arguments
+    
+    Raises:
+        ValueError: If the string cannot be split or contains an option that
+            is not allowed
+    
+    >>> parse_custom_options("-sV -p80,443 -T4 --top-ports=100")
+    ['-sV', '-p80,443', '-T4', '--top-ports=100']
+    >>> parse_custom_options("-sS -p 1-1000 -A --script=vuln")
+    ['-sS', '-p', '1-1000', '-A', '--script=vuln']
+    >>> parse_custom_options("-T 4 --script /tmp/evil.lua")
+    Traceback (most recent call last):
+    ValueError: Unsupported script specification: /tmp/evil.lua
+    >>> parse_custom_options("-sV -datadir=/tmp/evil -p 80")
+    Traceback (most recent call last):
+    ValueError: Unsupported nmap option: -datadir=/tmp/evil
+    >>> parse_custom_options("-datadir /tmp/evil")
+    Traceback (most recent call last):
+    ValueError: Unsupported nmap option: -datadir
+    >>> parse_custom_options("-proxies socks4://127.0.0.1:1080")
+    Traceback (most recent call last):
+    ValueError: Unsupported nmap option: -proxies
+    """
+    args = shlex.split(custom_options)
+    
+    for index, arg in enumerate(args):
+        if not arg.startswith("-") or arg == "-":
+            continue
+        if arg in _OUTPUT_OPTIONS:
+            if args[index + 1:index + 2] != ["-"]:
+                raise ValueError(f"{arg} may only write to stdout ('{arg} -')")
+            continue
+        if arg.startswith("--"):
+            name, has_value, value = arg.partition("=")
+            allowed = name in _ALLOWED_OPTIONS
+            if name == "--script":
+                script_arg(value if has_value else "".join(args[index + 1:index + 2]))
+        else:
+            # A single-dash token must be an allowed option as written or an
+            # attached-value form; anything else may be a single-dash long option
+            allowed = arg in _ALLOWED_OPTIONS or bool(_ATTACHED_VALUE_RE.match(arg))
+        if not allowed:
+            raise ValueError(f"Unsupported nmap option: {arg}")
+    
+    return args
 
 @app.tool(
     name="nmap_custom_scan",
-    description="Perform custom Nmap scan with user-defined options"
+    description="Perform custom Nmap scan with user-defined options",
+    structured_output=False
 )
 async def nmap_custom_scan(
     targets: str,
     custom_options: str,
-    output_format: str = "normal"
-) -> str:
+    output_format: str = "json",
+    ctx: Context = None
+) -> List[TextContent]:
     """Perform custom Nmap scan with user-defined options."""
     # Parse custom options
-    args = custom_options.split()
+    try:
+        args = parse_custom_options(custom_options)
+    except ValueError as e:
+        return text_blocks("Custom scan failed", str(e))
+    
+    # Hostnames must resolve to the address family nmap will scan
+    family = socket.AF_INET6 if "-6" in args else socket.AF_INET
+    try:
+        target_args, host_groups = await _dedupe_targets(targets, family)
+    except ValueError as e:
+        return text_blocks("Custom scan failed", str(e))
     
-    # Add output format if specified
+    # Add output format if specified; "json" is produced from XML by run_nmap_command
     if output_format == "xml":
         args.append("-oX")
         args.append("-")
+    elif output_format == "normal":
+        args.append("-oN")
+        args.append("-")
     elif output_format == "grepable":
         args.append("-oG")
         args.append("-")
     
-    args.append(targets)
+    args.extend(target_args)
     
-    result = run_nmap_command(args)
+    result = await run_nmap_command(args, ctx=ctx, targets=target_args)
     
     if result["success"]:
-        return f"Custom scan completed:\n\n{result['stdout']}"
+        return text_blocks(
+            "Custom scan completed",
+            format_host_groups(host_groups),
+            cache_note(result),
+            result["stdout"]
+        )
     else:
-        return f"Custom scan failed:\n\n{result['stderr']}"
+        return text_blocks("Custom scan failed", result["stderr"])
+
+@app.tool(
+    name="nmap_batch_scan",
+    description="Run a basic Nmap scan against several targets in parallel",
+    structured_output=False
+)
+async def nmap_batch_scan(
+    targets: List[str],
+    ports: str = "common",
+    scan_type: str = "quick",
+    ctx: Context = None
+) -> List[TextContent]:
+    """Run a basic Nmap scan against several targets in parallel."""
+    try:
+        targets, host_groups = await _dedupe_targets(" ".join(targets))
+    except ValueError as e:
+        return text_blocks("Batch scan failed", str(e))
+    
+    results = await asyncio.gather(*(
+        run_nmap_command(
+            (*basic_scan_args(ports, scan_type), target), ctx=ctx, targets=(target,)
+        )
+        for target in targets
+    ))
+    
+    sections = []
+    for target, result in zip(targets, results):
+        if result["success"]:
+            sections += [f"== {target} ==", cache_note(result), result["stdout"]]
+        else:
+            sections += [f"== {target} (failed) ==", result["stderr"]]
+    
+    succeeded = sum(result["success"] for result in results)
+    return text_blocks(
+        f"Batch scan completed ({succeeded}/{len(targets)} targets succeeded)",
+        format_host_groups(host_groups),
+        *sections
+    )
+
+def shard_targets(targets: List[str], shards: int) -> List[List[str]]:
+    """
+    Split target arguments into at most `shards` groups of similar size.
+    
+    CIDR blocks are cut into 2**ceil(log2(shards)) equal subnets first so a
+    single large network still spreads across every shard; other targets
+    (addresses, ranges, hostnames) are distributed as they are.
+    """
+    prefixlen_diff = math.ceil(math.log2(shards)) if shards > 1 else 0
+    units: List[str] = []
+    for target in targets:
+        network = None
+        if "/" in target:
+            try:
+                network = ipaddress.ip_network(target, strict=False)
+            except ValueError:
+                pass
+        if network is None:
+            units.append(target)
+            continue
+        diff = min(prefixlen_diff, network.max_prefixlen - network.prefixlen)
+        units.extend(str(subnet) for subnet in network.subnets(prefixlen_diff=diff))
+    
+    return [group for group in (units[i::shards] for i in range(shards)) if group]
+
+@app.tool(
+    name="nmap_multi_target_scan",
+    description="Split targets into shards and scan them with parallel nmap processes",
+    structured_output=False
+)
+async def nmap_multi_target_scan(
+    targets: str,
+    ports: str = "common",
+    scan_type: str = "quick",
+    shards: int = os.cpu_count() or 4,
+    ctx: Context = None
+) -> List[TextContent]:
+    """Split targets into shards and scan them with parallel nmap processes."""
+    try:
+        target_args, host_groups = await _dedupe_targets(targets)
+    except ValueError as e:
+        return text_blocks("Multi-target scan failed", str(e))
+    groups = shard_targets(target_args, max(1, min(shards, MAX_CONCURRENT_SCANS)))
+    
+    results = await asyncio.gather(*(
+        run_nmap_command((*basic_scan_args(ports, scan_type), *group), ctx=ctx, targets=group)
+        for group in groups
+    ))
+    
+    failures = [
+        f"{' '.join(group)}: {result['stderr']}"
+        for group, result in zip(groups, results)
+        if not result["success"]
+    ]
+    if len(failures) == len(groups):
+        return text_blocks("Multi-target scan failed", "\n".join(failures))
+    
+    merged: Dict[str, Any] = {"hosts": [], "stats": {"up": 0, "down": 0, "total": 0}}
+    for result in results:
+        scan = result.get("scan")
+        if scan is None:
+            continue
+        merged["hosts"].extend(scan["hosts"])
+        for k, v in scan.get("stats", {}).items():
+            merged["stats"][k] += v
+    
+    ages = [result["cached_age"] for result in results if "cached_age" in result]
+    cached = (
+        f"({len(ages)}/{len(groups)} shards cached, up to {int(max(ages))} s old)"
+        if ages else ""
+    )
+    
+    return text_blocks(
+        f"Multi-target scan completed ({len(groups)} shards)",
+        format_host_groups(host_groups),
+        cached,
+        _dump_scan(merged),
+        "Failed shards:\n" + "\n".join(failures) if failures else ""
+    )
 
 async def main():
     """Main function to run the FastMCP server with stdio transport."""